@@ -1,14 +1,23 @@
 from datetime import datetime, timedelta
 from typing import Optional
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+import jwt
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+import bcrypt
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
 import os
+import time
 from dotenv import load_dotenv
 
-from database import get_db
+from cache import token_cache_key, get_cached_user, cache_user
+from config import get_settings
+from database import AsyncSessionLocal, get_db
 from models import User
 
 load_dotenv()
@@ -18,19 +27,35 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-# パスワードハッシュ化
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# パスワードハッシュ化（argon2id、OWASP推奨パラメータ）
+password_hasher = PasswordHasher(memory_cost=19456, time_cost=2, parallelism=1)
+BCRYPT_HASH_LENGTH = 60
 
 # セキュリティ
-security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
+
+# テスト用のダミーユーザー（DEBUG時のみ使用）
+TEST_USER_EMAIL = "test@example.com"
+test_user_id: Optional[int] = None
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """パスワードの検証"""
-    return pwd_context.verify(plain_password, hashed_password)
+    if hashed_password.startswith("$2"):
+        # 移行前のbcryptハッシュ（長さが不正だとbcryptがpanicするため先に弾く）
+        if len(hashed_password) != BCRYPT_HASH_LENGTH:
+            return False
+        try:
+            return bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
+        except ValueError:
+            return False
+    try:
+        return password_hasher.verify(hashed_password, plain_password)
+    except (VerificationError, InvalidHashError):
+        return False
 
 def get_password_hash(password: str) -> str:
     """パスワードのハッシュ化"""
-    return pwd_context.hash(password)
+    return password_hasher.hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """アクセストークンの作成"""
@@ -43,67 +68,83 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(token: str) -> Optional[str]:
-    """トークンの検証"""
+def decode_token(token: str) -> Optional[dict]:
+    """トークンのデコード"""
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            return None
-        return email
-    except JWTError:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.PyJWTError:
+        return None
+
+async def attach_cached_user(db: AsyncSession, user_data: dict) -> User:
+    """キャッシュしたユーザー情報をセッションに紐づける（SELECTは発行しない）"""
+    user = User(**user_data)
+    make_transient_to_detached(user)
+    return await db.merge(user, load=False)
+
+async def get_user_from_token(token: str, db: AsyncSession) -> Optional[User]:
+    """トークンからユーザーを取得（Redisキャッシュを優先）"""
+    key = token_cache_key(token)
+    cached = await get_cached_user(key)
+    if cached is not None:
+        return await attach_cached_user(db, cached)
+
+    payload = decode_token(token)
+    if payload is None or payload.get("sub") is None:
         return None
 
-# async def get_current_user(
-#     credentials: HTTPAuthorizationCredentials = Depends(security),
-#     db: Session = Depends(get_db)
-# ) -> User:
-#     """現在のユーザーを取得"""
-#     credentials_exception = HTTPException(
-#         status_code=status.HTTP_401_UNAUTHORIZED,
-#         detail="認証に失敗しました",
-#         headers={"WWW-Authenticate": "Bearer"},
-#     )
-    
-#     try:
-#         token = credentials.credentials
-#         email = verify_token(token)
-#         if email is None:
-#             raise credentials_exception
-#     except JWTError:
-#         raise credentials_exception
-    
-#     user = db.query(User).filter(User.email == email).first()
-#     if user is None:
-#         raise credentials_exception
-    
-#     return user
+    user = await db.scalar(select(User).where(User.email == payload["sub"]))
+    if user is None:
+        return None
+
+    # トークンの残り有効期間だけキャッシュする
+    await cache_user(key, user, int(payload["exp"] - time.time()))
+    return user
 
+async def create_test_user() -> None:
+    """テスト用のダミーユーザーを作成（開発時の起動時に1回だけ実行）"""
+    global test_user_id
+    async with AsyncSessionLocal() as db:
+        user = await db.scalar(select(User).where(User.email == TEST_USER_EMAIL))
+        if user is None:
+            user = User(
+                email=TEST_USER_EMAIL,
+                hashed_password=await run_in_threadpool(get_password_hash, "testpassword"),
+                full_name="テストユーザー",
+                address="テスト県テスト市",
+                phone_number="09012345678",
+                imabari_residency="不明"
+            )
+            db.add(user)
+            try:
+                await db.commit()
+            except IntegrityError:
+                # 他のワーカーが先に作成した場合
+                await db.rollback()
+                user = await db.scalar(select(User).where(User.email == TEST_USER_EMAIL))
+        test_user_id = user.id
 
 async def get_current_user(
-    db: Session = Depends(get_db)
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    db: AsyncSession = Depends(get_db)
 ) -> User:
-    """テスト用のダミーユーザーを返す"""
-    # 実際の認証ロジックをスキップし、テスト用のダミーユーザーを返す
-    user = db.query(User).filter(User.email == "test@example.com").first()
-    if not user:
-        # ダミーユーザーが存在しない場合は作成
-        user = User(
-            email="test@example.com",
-            hashed_password=get_password_hash("testpassword"), # 適当なハッシュ化されたパスワード
-            user_name="テストユーザー",
-            owner_name="テストオーナー",
-            dog_name="テスト犬",
-            dog_breed="ミックス",
-            dog_gender="不明",
-            dog_age="1",
-            owner_tel="09012345678",
-            owner_address="テスト県テスト市",
-            registration_date=datetime.now(),
-            is_approved=True,
-            is_admin=False
-        )
-        db.add(user)
-        db.commit()
-        db.refresh(user)
-    return user 
\ No newline at end of file
+    """現在のユーザーを取得"""
+    if get_settings().debug and test_user_id is not None:
+        # 開発時は認証をスキップし、テスト用のダミーユーザーを返す
+        user = await db.get(User, test_user_id)
+        if user is not None:
+            return user
+
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="認証に失敗しました",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+    if credentials is None:
+        raise credentials_exception
+
+    user = await get_user_from_token(credentials.credentials, db)
+    if user is None:
+        raise credentials_exception
+
+    return user
\ No newline at end of file
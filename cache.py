@@ -0,0 +1,97 @@
+import hashlib
+from datetime import datetime
+from typing import Optional
+import os
+
+import msgpack
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from dotenv import load_dotenv
+from fastapi_cache import FastAPICache
+
+load_dotenv()
+
+# Redis URL（本番では maxmemory-policy=allkeys-lfu を推奨）
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+redis_client = Redis.from_url(REDIS_URL)
+
+# レスポンスキャッシュの有効期間（秒）
+CACHE_TTL_SHORT = 60
+CACHE_TTL_NORMAL = 300
+CACHE_TTL_LONG = 3600
+
+def request_key_builder(func, namespace: str = "", *, request=None, response=None, args=None, kwargs=None) -> str:
+    """パスとクエリ文字列からレスポンスキャッシュのキーを生成（DBセッションなどの依存は含めない）"""
+    return f"{namespace}:{request.url.path}?{request.url.query}"
+
+async def clear_response_cache(namespace: str) -> None:
+    """レスポンスキャッシュを名前空間ごとに削除（障害時は何もしない）"""
+    try:
+        await FastAPICache.clear(namespace=namespace)
+    except RedisError:
+        pass
+
+# キャッシュするユーザーのカラム（パスワードハッシュは共有キャッシュに置かない）
+USER_CACHE_FIELDS = (
+    "id", "email", "full_name", "address",
+    "phone_number", "imabari_residency", "created_at", "updated_at"
+)
+
+def user_to_dict(user) -> dict:
+    """キャッシュ用にユーザーのカラム値を取り出す"""
+    return {field: getattr(user, field) for field in USER_CACHE_FIELDS}
+
+def token_cache_key(token: str) -> str:
+    """トークンのハッシュからキャッシュキーを生成"""
+    digest = hashlib.blake2b(token.encode(), digest_size=16).hexdigest()
+    return f"auth:{digest}"
+
+def user_tokens_key(user_id: int) -> str:
+    """ユーザーに紐づくトークンキー一覧のキー"""
+    return f"auth:user:{user_id}"
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+async def get_cached_user(key: str) -> Optional[dict]:
+    """キャッシュからユーザー情報を取得（障害時はミス扱い）"""
+    try:
+        data = await redis_client.get(key)
+    except RedisError:
+        return None
+    if data is None:
+        return None
+    user_data = msgpack.unpackb(data)
+    for field in ("created_at", "updated_at"):
+        if user_data.get(field):
+            user_data[field] = datetime.fromisoformat(user_data[field])
+    return user_data
+
+async def cache_user(key: str, user, ttl: int) -> None:
+    """ユーザー情報をキャッシュに保存"""
+    if ttl <= 0:
+        return
+    user_data = {field: _encode_value(value) for field, value in user_to_dict(user).items()}
+    tokens_key = user_tokens_key(user.id)
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.set(key, msgpack.packb(user_data), ex=ttl)
+            pipe.sadd(tokens_key, key)
+            pipe.ttl(tokens_key)
+            *_, tokens_ttl = await pipe.execute()
+        # 一覧の有効期間は延長のみ（短いトークンで縮めると他のトークンを無効化できなくなる）
+        if tokens_ttl < ttl:
+            await redis_client.expire(tokens_key, ttl)
+    except RedisError:
+        pass
+
+async def invalidate_user(user) -> None:
+    """ユーザーのキャッシュを無効化"""
+    try:
+        keys = await redis_client.smembers(user_tokens_key(user.id))
+        await redis_client.delete(user_tokens_key(user.id), *keys)
+    except RedisError:
+        pass
@@ -1,4 +1,5 @@
 import os
+from functools import lru_cache
 from typing import List
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
@@ -45,10 +46,8 @@ class Settings(BaseSettings):
         env_file = ".env"
         case_sensitive = False
 
-# 設定インスタンス
-settings = Settings()
-
-# 環境変数から読み込み
+# 環境変数から読み込み（初回のみ生成してキャッシュ）
+@lru_cache(maxsize=1)
 def get_settings() -> Settings:
     """設定を取得"""
-    return settings 
\ No newline at end of file
+    return Settings() 
\ No newline at end of file
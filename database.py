@@ -1,6 +1,5 @@
-from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 import os
 from dotenv import load_dotenv
 
@@ -9,22 +8,19 @@ load_dotenv()
 # データベースURL（デフォルトはSQLite）
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./satoyama_dogrun.db")
 
-# SQLiteの場合の設定
-if DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(
-        DATABASE_URL, connect_args={"check_same_thread": False}
-    )
-else:
-    # PostgreSQLの場合
-    engine = create_engine(DATABASE_URL)
+# 非同期ドライバを指定（SQLite: aiosqlite / PostgreSQL: asyncpg）
+if DATABASE_URL.startswith("sqlite:"):
+    DATABASE_URL = DATABASE_URL.replace("sqlite:", "sqlite+aiosqlite:", 1)
+elif DATABASE_URL.startswith("postgresql:"):
+    DATABASE_URL = DATABASE_URL.replace("postgresql:", "postgresql+asyncpg:", 1)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = create_async_engine(DATABASE_URL)
+
+# コミット後に属性を失効させない（非同期では遅延ロードができないため）
+AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False)
 
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close() 
\ No newline at end of file
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
\ No newline at end of file
@@ -1,32 +1,48 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Query, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from typing import List, Optional
 import uvicorn
+from sqlalchemy import and_, exists, func, or_, select, update
+from sqlalchemy.orm import selectinload
 from datetime import datetime, date
 import os
 from dotenv import load_dotenv
+from pydantic import TypeAdapter
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.redis import RedisBackend
+from fastapi_cache.decorator import cache
 
 from models import (
     User, Dog, Post, Comment, Event, Notice, Tag,
     UserCreate, UserResponse, DogCreate, DogResponse,
     PostCreate, PostResponse, CommentCreate, CommentResponse,
-    EventResponse, NoticeResponse, TagResponse
+    EventResponse, NoticeResponse, TagResponse, CursorPage
 )
-from database import engine, get_db
-from auth import get_current_user, create_access_token, verify_password, get_password_hash
+from database import Base, engine, get_db
+from cache import (
+    redis_client, invalidate_user, clear_response_cache, request_key_builder,
+    CACHE_TTL_SHORT, CACHE_TTL_LONG
+)
+from auth import (
+    get_current_user, create_access_token, verify_password, get_password_hash, create_test_user
+)
+from config import get_settings
 from schemas import (
     LoginRequest, RegisterRequest, CreatePostRequest, AddCommentRequest,
-    AddDogRequest, UpdateUserProfileRequest, CalendarRequest
+    AddDogRequest, UpdateUserProfileRequest, CalendarRequest, TokenResponse
 )
+from utils import encode_cursor, decode_cursor, create_cursor_pagination_response
 
 load_dotenv()
 
 app = FastAPI(
     title="里山ドッグラン API",
     description="里山ドッグランの管理システムAPI",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # CORS設定
@@ -40,44 +56,84 @@ app.add_middleware(
 
 security = HTTPBearer()
 
-# データベース初期化
-from database import Base
-Base.metadata.create_all(bind=engine)
+# 一覧レスポンス用のバリデータ（一括変換で行ごとのfrom_ormを避ける）
+DOG_LIST_ADAPTER = TypeAdapter(List[DogResponse])
+EVENT_LIST_ADAPTER = TypeAdapter(List[EventResponse])
+NOTICE_LIST_ADAPTER = TypeAdapter(List[NoticeResponse])
+TAG_LIST_ADAPTER = TypeAdapter(List[TagResponse])
+
+@app.on_event("startup")
+async def startup():
+    """データベースとレスポンスキャッシュの初期化"""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    if get_settings().debug:
+        await create_test_user()
+
+    FastAPICache.init(
+        RedisBackend(redis_client), prefix="satoyama", key_builder=request_key_builder
+    )
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Redis・データベース接続のクローズ"""
+    await redis_client.aclose()
+    await engine.dispose()
+
+# ページネーション
+def paginate(stmt, model, cursor: Optional[str], limit: int):
+    """作成日時の新しい順にキーセットページネーションを適用（次ページ判定用に1件多く取得）"""
+    if cursor:
+        position = decode_cursor(cursor)
+        if position is None:
+            raise HTTPException(status_code=400, detail="カーソルが不正です")
+        created_at, item_id = position
+        stmt = stmt.where(or_(
+            model.created_at < created_at,
+            and_(model.created_at == created_at, model.id < item_id)
+        ))
+    return stmt.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1)
+
+def get_next_cursor(items: list, limit: int) -> Optional[str]:
+    """次ページのカーソルを取得"""
+    if len(items) <= limit:
+        return None
+    last = items[limit - 1]
+    return encode_cursor(last.created_at, last.id)
 
 # 認証関連
-@app.post("/auth/register", response_model=UserResponse)
+@app.post("/auth/register", response_model=TokenResponse)
 async def register(request: RegisterRequest, db=Depends(get_db)):
     """ユーザー登録"""
     # メールアドレスの重複チェック
-    existing_user = db.query(User).filter(User.email == request.email).first()
-    if existing_user:
+    if await db.scalar(select(exists().where(User.email == request.email))):
         raise HTTPException(status_code=400, detail="このメールアドレスは既に登録されています")
     
-    # ユーザー作成
+    # ユーザー作成（ハッシュ化はイベントループを塞がないようスレッドで実行）
+    hashed_password = await run_in_threadpool(get_password_hash, request.password)
     user = User(
         email=request.email,
-        hashed_password=get_password_hash(request.password),
+        hashed_password=hashed_password,
         full_name=request.full_name,
         address=request.address,
         phone_number=request.phone_number,
-        imabari_residency=request.imabari_residency,
-        application_date=request.application_date
+        imabari_residency=request.imabari_residency
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    # コミットせずにuser.idを採番し、犬の登録と同一トランザクションにする
+    await db.flush()
     
     # 犬の登録
     dog = Dog(
         name=request.dog_name,
         breed=request.dog_breed,
         weight=request.dog_weight,
-        birth_year=request.dog_birth_year,
+        personality=[],
         owner_id=user.id
     )
     db.add(dog)
-    db.commit()
-    db.refresh(dog)
+    await db.commit()
     
     access_token = create_access_token(data={"sub": user.email})
     return {"access_token": access_token, "token_type": "bearer"}
@@ -85,8 +141,8 @@ async def register(request: RegisterRequest, db=Depends(get_db)):
 @app.post("/auth/login")
 async def login(request: LoginRequest, db=Depends(get_db)):
     """ログイン"""
-    user = db.query(User).filter(User.email == request.email).first()
-    if not user or not verify_password(request.password, user.hashed_password):
+    user = await db.scalar(select(User).where(User.email == request.email))
+    if not user or not await run_in_threadpool(verify_password, request.password, user.hashed_password):
         raise HTTPException(status_code=401, detail="メールアドレスまたはパスワードが正しくありません")
     
     access_token = create_access_token(data={"sub": user.email})
@@ -95,8 +151,7 @@ async def login(request: LoginRequest, db=Depends(get_db)):
 @app.post("/auth/forgot-password")
 async def forgot_password(email: str, db=Depends(get_db)):
     """パスワードリセット"""
-    user = db.query(User).filter(User.email == email).first()
-    if not user:
+    if not await db.scalar(select(exists().where(User.email == email))):
         raise HTTPException(status_code=404, detail="ユーザーが見つかりません")
     
     # 実際の実装ではメール送信処理を行う
@@ -120,16 +175,17 @@ async def update_user_profile(
     current_user.phone_number = request.phone_number
     current_user.imabari_residency = request.imabari_residency
     
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await db.refresh(current_user)
+    await invalidate_user(current_user)
     return UserResponse.from_orm(current_user)
 
 # 犬のプロフィール関連
 @app.get("/dogs", response_model=List[DogResponse])
 async def get_user_dogs(current_user: User = Depends(get_current_user), db=Depends(get_db)):
     """ユーザーの犬一覧取得"""
-    dogs = db.query(Dog).filter(Dog.owner_id == current_user.id).all()
-    return [DogResponse.from_orm(dog) for dog in dogs]
+    dogs = (await db.scalars(select(Dog).where(Dog.owner_id == current_user.id))).all()
+    return DOG_LIST_ADAPTER.validate_python(dogs, from_attributes=True)
 
 @app.post("/dogs", response_model=DogResponse)
 async def add_dog(
@@ -147,8 +203,8 @@ async def add_dog(
         owner_id=current_user.id
     )
     db.add(dog)
-    db.commit()
-    db.refresh(dog)
+    await db.commit()
+    await db.refresh(dog)
     return DogResponse.from_orm(dog)
 
 @app.put("/dogs/{dog_id}", response_model=DogResponse)
@@ -159,8 +215,8 @@ async def update_dog(
     db=Depends(get_db)
 ):
     """犬の情報更新"""
-    dog = db.query(Dog).filter(Dog.id == dog_id, Dog.owner_id == current_user.id).first()
-    if not dog:
+    dog = await db.get(Dog, dog_id)
+    if dog is None or dog.owner_id != current_user.id:
         raise HTTPException(status_code=404, detail="犬が見つかりません")
     
     dog.name = request.name
@@ -169,8 +225,8 @@ async def update_dog(
     dog.personality = request.personality
     dog.last_vaccination_date = request.last_vaccination_date
     
-    db.commit()
-    db.refresh(dog)
+    await db.commit()
+    await db.refresh(dog)
     return DogResponse.from_orm(dog)
 
 @app.delete("/dogs/{dog_id}")
@@ -180,32 +236,60 @@ async def delete_dog(
     db=Depends(get_db)
 ):
     """犬の削除"""
-    dog = db.query(Dog).filter(Dog.id == dog_id, Dog.owner_id == current_user.id).first()
-    if not dog:
+    dog = await db.get(Dog, dog_id)
+    if dog is None or dog.owner_id != current_user.id:
         raise HTTPException(status_code=404, detail="犬が見つかりません")
     
-    db.delete(dog)
-    db.commit()
+    await db.delete(dog)
+    await db.commit()
     return {"message": "削除しました"}
 
 # 投稿関連
-@app.get("/posts", response_model=List[PostResponse])
+def build_post_response(post: Post, user_name: str, comments_count: int) -> PostResponse:
+    """投稿レスポンスを作成"""
+    return PostResponse(
+        id=post.id,
+        content=post.content,
+        tag=post.tag,
+        hashtags=post.hashtags,
+        likes=post.likes,
+        user_id=post.user_id,
+        created_at=post.created_at,
+        user_name=user_name,
+        comments_count=comments_count
+    )
+
+@app.get("/posts", response_model=CursorPage[PostResponse])
 async def get_posts(
     tag: Optional[str] = None,
     search: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
     db=Depends(get_db)
 ):
     """投稿一覧取得"""
-    query = db.query(Post)
+    # 投稿者とコメント数をまとめて取得（N+1クエリを回避）
+    stmt = (
+        select(Post, func.count(Comment.id).label("comments_count"))
+        .outerjoin(Post.comments)
+        .options(selectinload(Post.user))
+        .group_by(Post.id)
+    )
     
     if tag and tag != "all":
-        query = query.filter(Post.tag == tag)
+        stmt = stmt.where(Post.tag == tag)
     
     if search:
-        query = query.filter(Post.content.contains(search))
+        stmt = stmt.where(Post.content.contains(search))
     
-    posts = query.order_by(Post.created_at.desc()).all()
-    return [PostResponse.from_orm(post) for post in posts]
+    rows = (await db.execute(paginate(stmt, Post, cursor, limit))).all()
+    items = [
+        build_post_response(post, post.user.full_name, comments_count)
+        for post, comments_count in rows[:limit]
+    ]
+    return create_cursor_pagination_response(
+        items, get_next_cursor([post for post, _ in rows], limit)
+    )
 
 @app.post("/posts", response_model=PostResponse)
 async def create_post(
@@ -221,9 +305,9 @@ async def create_post(
         user_id=current_user.id
     )
     db.add(post)
-    db.commit()
-    db.refresh(post)
-    return PostResponse.from_orm(post)
+    await db.commit()
+    await db.refresh(post)
+    return build_post_response(post, current_user.full_name, 0)
 
 @app.post("/posts/{post_id}/like")
 async def like_post(
@@ -232,14 +316,19 @@ async def like_post(
     db=Depends(get_db)
 ):
     """投稿にいいね"""
-    post = db.query(Post).filter(Post.id == post_id).first()
-    if not post:
+    # いいねの処理（実際の実装では中間テーブルを使用）
+    # 読み取りと更新を分けず、1回のUPDATEで加算して更新の消失を防ぐ
+    likes = (await db.execute(
+        update(Post)
+        .where(Post.id == post_id)
+        .values(likes=Post.likes + 1)
+        .returning(Post.likes)
+    )).scalar_one_or_none()
+    if likes is None:
         raise HTTPException(status_code=404, detail="投稿が見つかりません")
     
-    # いいねの処理（実際の実装では中間テーブルを使用）
-    post.likes += 1
-    db.commit()
-    return {"message": "いいねしました"}
+    await db.commit()
+    return {"message": "いいねしました", "likes": likes}
 
 @app.post("/posts/{post_id}/comments", response_model=CommentResponse)
 async def add_comment(
@@ -249,8 +338,7 @@ async def add_comment(
     db=Depends(get_db)
 ):
     """コメント追加"""
-    post = db.query(Post).filter(Post.id == post_id).first()
-    if not post:
+    if not await db.scalar(select(exists().where(Post.id == post_id))):
         raise HTTPException(status_code=404, detail="投稿が見つかりません")
     
     comment = Comment(
@@ -259,16 +347,24 @@ async def add_comment(
         user_id=current_user.id
     )
     db.add(comment)
-    db.commit()
-    db.refresh(comment)
+    await db.commit()
+    await db.refresh(comment)
     return CommentResponse.from_orm(comment)
 
 # イベント関連
-@app.get("/events", response_model=List[EventResponse])
-async def get_events(db=Depends(get_db)):
+@app.get("/events", response_model=CursorPage[EventResponse])
+@cache(expire=CACHE_TTL_SHORT, namespace="events")
+async def get_events(
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db=Depends(get_db)
+):
     """イベント一覧取得"""
-    events = db.query(Event).all()
-    return [EventResponse.from_orm(event) for event in events]
+    events = (await db.scalars(paginate(select(Event), Event, cursor, limit))).all()
+    return create_cursor_pagination_response(
+        EVENT_LIST_ADAPTER.validate_python(events[:limit], from_attributes=True),
+        get_next_cursor(events, limit)
+    )
 
 @app.get("/calendar/{year}/{month}")
 async def get_calendar(year: int, month: int):
@@ -281,11 +377,19 @@ async def get_calendar(year: int, month: int):
     }
 
 # お知らせ関連
-@app.get("/notices", response_model=List[NoticeResponse])
-async def get_notices(db=Depends(get_db)):
+@app.get("/notices", response_model=CursorPage[NoticeResponse])
+@cache(expire=CACHE_TTL_SHORT, namespace="notices")
+async def get_notices(
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db=Depends(get_db)
+):
     """お知らせ一覧取得"""
-    notices = db.query(Notice).order_by(Notice.created_at.desc()).all()
-    return [NoticeResponse.from_orm(notice) for notice in notices]
+    notices = (await db.scalars(paginate(select(Notice), Notice, cursor, limit))).all()
+    return create_cursor_pagination_response(
+        NOTICE_LIST_ADAPTER.validate_python(notices[:limit], from_attributes=True),
+        get_next_cursor(notices, limit)
+    )
 
 @app.put("/notices/{notice_id}/read")
 async def mark_notice_as_read(
@@ -293,12 +397,13 @@ async def mark_notice_as_read(
     db=Depends(get_db)
 ):
     """お知らせを既読にする"""
-    notice = db.query(Notice).filter(Notice.id == notice_id).first()
+    notice = await db.get(Notice, notice_id)
     if not notice:
         raise HTTPException(status_code=404, detail="お知らせが見つかりません")
     
     notice.read = True
-    db.commit()
+    await db.commit()
+    await clear_response_cache("notices")
     return {"message": "既読にしました"}
 
 # 入場関連
@@ -326,10 +431,11 @@ async def exit_dog_run(current_user: User = Depends(get_current_user)):
 
 # タグ関連
 @app.get("/tags", response_model=List[TagResponse])
+@cache(expire=CACHE_TTL_LONG, namespace="tags")
 async def get_tags(db=Depends(get_db)):
     """タグ一覧取得"""
-    tags = db.query(Tag).all()
-    return [TagResponse.from_orm(tag) for tag in tags]
+    tags = (await db.scalars(select(Tag))).all()
+    return TAG_LIST_ADAPTER.validate_python(tags, from_attributes=True)
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
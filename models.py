@@ -1,11 +1,20 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, JSON
-from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, JSON, Index, DDL, event, func
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Generic, List, Optional, TypeVar
 
-Base = declarative_base()
+from database import Base
+
+# 作成・更新日時はDB側で記録する
+# SQLiteのCURRENT_TIMESTAMPは秒精度の文字列なので、比較できるよう同じ書式で保存する
+Timestamp = DateTime(timezone=True).with_variant(
+    sqlite.DATETIME(
+        storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"
+    ),
+    "sqlite"
+)
 
 # SQLAlchemy Models
 class User(Base):
@@ -18,8 +27,8 @@ class User(Base):
     address = Column(String)
     phone_number = Column(String)
     imabari_residency = Column(String)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(Timestamp, server_default=func.now())
+    updated_at = Column(Timestamp, server_default=func.now(), onupdate=func.now())
     
     # Relationships
     dogs = relationship("Dog", back_populates="owner")
@@ -35,9 +44,9 @@ class Dog(Base):
     weight = Column(String)
     personality = Column(JSON)  # List of strings
     last_vaccination_date = Column(String)
-    owner_id = Column(Integer, ForeignKey("users.id"))
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    owner_id = Column(Integer, ForeignKey("users.id"), index=True)
+    created_at = Column(Timestamp, server_default=func.now())
+    updated_at = Column(Timestamp, server_default=func.now(), onupdate=func.now())
     
     # Relationships
     owner = relationship("User", back_populates="dogs")
@@ -47,12 +56,12 @@ class Post(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     content = Column(Text)
-    tag = Column(String)
+    tag = Column(String, index=True)
     hashtags = Column(String, nullable=True)
     likes = Column(Integer, default=0)
     user_id = Column(Integer, ForeignKey("users.id"))
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(Timestamp, server_default=func.now(), index=True)
+    updated_at = Column(Timestamp, server_default=func.now(), onupdate=func.now())
     
     # Relationships
     user = relationship("User", back_populates="posts")
@@ -63,14 +72,27 @@ class Comment(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     text = Column(Text)
-    post_id = Column(Integer, ForeignKey("posts.id"))
-    user_id = Column(Integer, ForeignKey("users.id"))
-    created_at = Column(DateTime, default=datetime.utcnow)
+    post_id = Column(Integer, ForeignKey("posts.id"), index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    created_at = Column(Timestamp, server_default=func.now())
     
     # Relationships
     post = relationship("Post", back_populates="comments")
     user = relationship("User", back_populates="comments")
 
+# 投稿本文の部分一致検索用（PostgreSQLのみ、pg_trgmのGINインデックス）
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql")
+)
+Index(
+    "ix_posts_content_trgm",
+    Post.content,
+    postgresql_using="gin",
+    postgresql_ops={"content": "gin_trgm_ops"}
+).ddl_if(dialect="postgresql")
+
 class Event(Base):
     __tablename__ = "events"
     
@@ -79,7 +101,7 @@ class Event(Base):
     date = Column(String)
     time = Column(String)
     participants = Column(Integer, default=0)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(Timestamp, server_default=func.now(), index=True)
 
 class Notice(Base):
     __tablename__ = "notices"
@@ -88,7 +110,7 @@ class Notice(Base):
     title = Column(String)
     content = Column(Text)
     read = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(Timestamp, server_default=func.now(), index=True)
 
 class Tag(Base):
     __tablename__ = "tags"
@@ -125,6 +147,7 @@ class DogCreate(DogBase):
     pass
 
 class DogResponse(DogBase):
+    last_vaccination_date: Optional[str] = None  # 登録時の犬は未入力
     id: int
     owner_id: int
     created_at: datetime
@@ -192,4 +215,11 @@ class TagResponse(BaseModel):
     label: str
     
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True
+
+T = TypeVar("T")
+
+class CursorPage(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None
+    has_next: bool
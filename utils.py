@@ -1,18 +1,29 @@
 import re
+import base64
 import hashlib
-import uuid
-from datetime import datetime, timedelta
+import secrets
+from pathlib import PurePosixPath
+import orjson
+from datetime import datetime
+from dateutil.relativedelta import relativedelta
 from typing import List, Optional
 from fastapi import UploadFile
-from config import settings
+from config import get_settings
+
+# 正規表現パターン
+_EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+# 日本の電話番号形式（ハイフンありなし両対応）
+_PHONE_RE = re.compile(r'^(\+81|0)[0-9-]{9,}$')
+_UNSAFE_FILENAME_CHARS_RE = re.compile(r'[^\w\-_\.]')
+_HASHTAG_RE = re.compile(r'#\w+')
 
 def validate_email(email: str) -> bool:
     """メールアドレスの形式を検証"""
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return re.match(pattern, email) is not None
+    return _EMAIL_RE.match(email) is not None
 
 def validate_password(password: str) -> bool:
     """パスワードの強度を検証"""
+    settings = get_settings()
     if len(password) < settings.min_password_length:
         return False
     
@@ -24,19 +35,16 @@ def validate_password(password: str) -> bool:
 
 def validate_phone_number(phone: str) -> bool:
     """電話番号の形式を検証"""
-    # 日本の電話番号形式（ハイフンありなし両対応）
-    pattern = r'^(\+81|0)[0-9-]{9,}$'
-    return re.match(pattern, phone) is not None
+    return _PHONE_RE.match(phone) is not None
 
 def generate_unique_filename(original_filename: str) -> str:
     """ユニークなファイル名を生成"""
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    unique_id = str(uuid.uuid4())[:8]
-    extension = original_filename.split('.')[-1] if '.' in original_filename else ''
-    return f"{timestamp}_{unique_id}.{extension}"
+    # 96ビットの乱数で十分に一意なため、タイムスタンプは付与しない
+    return f"{secrets.token_urlsafe(12)}{PurePosixPath(original_filename).suffix}"
 
 def validate_file_upload(file: UploadFile) -> bool:
     """ファイルアップロードを検証"""
+    settings = get_settings()
     # ファイルサイズの検証
     if hasattr(file, 'size') and file.size > settings.max_file_size:
         return False
@@ -49,11 +57,10 @@ def validate_file_upload(file: UploadFile) -> bool:
 
 def sanitize_filename(filename: str) -> str:
     """ファイル名をサニタイズ"""
-    # 危険な文字を除去
-    filename = re.sub(r'[^\w\-_\.]', '', filename)
+    # ディレクトリ部分を除き、危険な文字を除去
+    filename = _UNSAFE_FILENAME_CHARS_RE.sub('', PurePosixPath(filename).name)
     # パストラバーサル攻撃を防ぐ
-    filename = filename.replace('..', '').replace('/', '').replace('\\', '')
-    return filename
+    return filename.replace('..', '')
 
 def format_datetime(dt: datetime) -> str:
     """日時をフォーマット"""
@@ -73,12 +80,17 @@ def calculate_age(birth_date: datetime) -> int:
 
 def is_vaccine_up_to_date(vaccination_date: datetime, months_valid: int = 12) -> bool:
     """ワクチンが有効期限内かチェック"""
-    cutoff_date = datetime.now() - timedelta(days=months_valid * 30)
+    cutoff_date = datetime.now() - relativedelta(months=months_valid)
     return vaccination_date >= cutoff_date
 
+def check_vaccines_up_to_date(vaccination_dates: List[datetime], months_valid: int = 12) -> List[bool]:
+    """複数のワクチン接種日をまとめてチェック（基準日は1回だけ計算）"""
+    cutoff_date = datetime.now() - relativedelta(months=months_valid)
+    return [vaccination_date >= cutoff_date for vaccination_date in vaccination_dates]
+
 def extract_hashtags(text: str) -> List[str]:
     """テキストからハッシュタグを抽出"""
-    hashtags = re.findall(r'#\w+', text)
+    hashtags = _HASHTAG_RE.findall(text)
     return list(set(hashtags))  # 重複を除去
 
 def truncate_text(text: str, max_length: int = 100) -> str:
@@ -95,25 +107,27 @@ def generate_qr_code_data(user_id: int, dog_ids: List[int]) -> str:
         "timestamp": datetime.now().isoformat(),
         "type": "dogrun_entry"
     }
-    return str(data)
+    return orjson.dumps(data).decode()
 
 def validate_qr_code_data(data: str) -> Optional[dict]:
     """QRコードデータを検証"""
     try:
-        import ast
-        parsed_data = ast.literal_eval(data)
-        required_keys = ["user_id", "dog_ids", "timestamp", "type"]
-        
-        if not all(key in parsed_data for key in required_keys):
-            return None
-        
-        if parsed_data["type"] != "dogrun_entry":
-            return None
-        
-        return parsed_data
-    except (ValueError, SyntaxError):
+        parsed_data = orjson.loads(data)
+    except orjson.JSONDecodeError:
         return None
 
+    if not isinstance(parsed_data, dict):
+        return None
+
+    required_keys = ["user_id", "dog_ids", "timestamp", "type"]
+    if not all(key in parsed_data for key in required_keys):
+        return None
+
+    if parsed_data["type"] != "dogrun_entry":
+        return None
+
+    return parsed_data
+
 def create_pagination_response(items: List, total: int, page: int, size: int) -> dict:
     """ページネーション用のレスポンスを作成"""
     return {
@@ -126,6 +140,27 @@ def create_pagination_response(items: List, total: int, page: int, size: int) ->
         "has_prev": page > 1
     }
 
+def encode_cursor(created_at: datetime, item_id: int) -> str:
+    """キーセットページネーション用のカーソルを作成（URLセーフなbase64）"""
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}_{item_id}".encode()).decode()
+
+def decode_cursor(cursor: str) -> Optional[tuple]:
+    """カーソルを (作成日時, ID) に復元"""
+    try:
+        decoded = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, _, item_id = decoded.rpartition("_")
+        return datetime.fromisoformat(created_at), int(item_id)
+    except ValueError:
+        return None
+
+def create_cursor_pagination_response(items: List, next_cursor: Optional[str]) -> dict:
+    """キーセットページネーション用のレスポンスを作成"""
+    return {
+        "items": items,
+        "next_cursor": next_cursor,
+        "has_next": next_cursor is not None
+    }
+
 def log_activity(user_id: int, action: str, details: Optional[dict] = None):
     """アクティビティをログに記録"""
     timestamp = datetime.now().isoformat()